@@ -1,31 +1,58 @@
-import json
+import asyncio
+import orjson
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional
 import logging
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
+from google import genai
+from async_lru import alru_cache
 import os
 
 logger = logging.getLogger(__name__)
 
 # Initialize Gemini LLM
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+MODEL_NAME = "gemini-1.5-flash"
 llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash",
+    model=MODEL_NAME,
     google_api_key=GOOGLE_API_KEY,
     temperature=0.7
 )
 
+# Gemini Batch API client for non-interactive generation (created on first use)
+_genai_client = None
+
+# Article token budget per prompt (about the old 8000-character cap)
+MAX_CONTENT_TOKENS = 2000
+
+# Cap on concurrent count_tokens calls when building a batch
+token_count_semaphore = asyncio.Semaphore(10)
+
+# Markdown code fences LLMs sometimes wrap JSON in
+CODEFENCE_RE = re.compile(r'```(?:json)?\n?')
+
+# Finished batch job states. The SDK passes some Gemini API states through
+# unmapped, so both the JOB_STATE_* and BATCH_STATE_* spellings are listed
+BATCH_SUCCEEDED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED", "BATCH_STATE_SUCCEEDED"}
+BATCH_FAILED_STATES = {
+    "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED",
+    "BATCH_STATE_FAILED", "BATCH_STATE_CANCELLED", "BATCH_STATE_EXPIRED"
+}
+
+class BatchJobFailedError(Exception):
+    """A Gemini batch job ended without succeeding (failed, cancelled or expired)."""
+
 # ============ PROMPT TEMPLATES ============
 
 QUIZ_GENERATION_PROMPT = PromptTemplate(
-    input_variables=["content", "num_questions"],
-    template="""You are an expert educator. Based on the following Wikipedia article content, generate a JSON array of {num_questions} quiz questions.
+    input_variables=["content", "title", "num_questions"],
+    template="""You are an expert educator. Based on the following Wikipedia article about "{title}", generate {num_questions} quiz questions and 5-7 related Wikipedia topics.
 
 ARTICLE CONTENT:
 {content}
 
-IMPORTANT REQUIREMENTS:
+QUIZ REQUIREMENTS:
 1. Generate questions ONLY from facts explicitly stated in the article
 2. Avoid hallucinations - do not invent information
 3. Include questions of varying difficulty: mix of easy, medium, and hard
@@ -33,44 +60,34 @@ IMPORTANT REQUIREMENTS:
 5. For each question, provide a brief explanation citing the relevant section
 6. Ensure questions test comprehension, not just memorization
 
-Return ONLY a valid JSON array with this exact structure (no markdown, no extra text):
-[
-  {{
-    "question": "Question text?",
-    "options": ["Option A", "Option B", "Option C", "Option D"],
-    "answer": "Correct option text",
-    "difficulty": "easy|medium|hard",
-    "explanation": "Why this answer is correct with section reference"
-  }}
-]
-
-Generate the questions now:"""
-)
-
-RELATED_TOPICS_PROMPT = PromptTemplate(
-    input_variables=["content", "title"],
-    template="""Based on this Wikipedia article about "{title}", identify 5-7 related Wikipedia topics that a reader should explore for deeper understanding.
-
-ARTICLE CONTENT:
-{content}
-
-Requirements:
+RELATED TOPICS REQUIREMENTS:
 1. Topics should be closely related to the article's subject matter
 2. They should help understand the context, history, or applications
-3. Return ONLY a JSON array of topic names as strings
-4. Topics should be real Wikipedia articles (no fictional topics)
+3. Topics should be real Wikipedia articles (no fictional topics)
 
-Return ONLY a valid JSON array like this (no markdown, no extra text):
-["Topic 1", "Topic 2", "Topic 3", "Topic 4", "Topic 5"]
+Return ONLY a valid JSON object with this exact structure (no markdown, no extra text):
+{{
+  "quiz": [
+    {{
+      "question": "Question text?",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "answer": "Correct option text",
+      "difficulty": "easy|medium|hard",
+      "explanation": "Why this answer is correct with section reference"
+    }}
+  ],
+  "related_topics": ["Topic 1", "Topic 2", "Topic 3", "Topic 4", "Topic 5"]
+}}
 
-Generate the topics now:"""
+Generate the quiz now:"""
 )
 
 # ============ MAIN FUNCTIONS ============
 
-def generate_quiz_with_llm(content: str, title: str, sections: List[str], num_questions: int = 7) -> Dict:
+async def generate_quiz_with_llm(content: str, title: str, sections: List[str], num_questions: int = 7) -> Dict:
     """
     Generate quiz questions and related topics using Gemini LLM.
+    Both are requested in a single prompt so the article is only sent once.
     
     Args:
         content: Full article content from scraper
@@ -87,18 +104,15 @@ def generate_quiz_with_llm(content: str, title: str, sections: List[str], num_qu
         
         logger.info(f"Generating {num_questions} quiz questions for: {title}")
         
-        # Generate quiz questions
-        quiz_questions = generate_quiz_questions(content, num_questions)
+        prompt = await build_quiz_prompt(content, title, num_questions)
         
-        # Generate related topics
-        related_topics = generate_related_topics(content, title)
+        # Call LLM
+        response = await llm.ainvoke(prompt)
+        quiz_data = parse_quiz_response(response.content.strip(), num_questions)
         
         logger.info(f"Successfully generated quiz for: {title}")
         
-        return {
-            "quiz": quiz_questions,
-            "related_topics": related_topics
-        }
+        return quiz_data
     
     except Exception as e:
         logger.error(f"Error in quiz generation: {str(e)}")
@@ -108,78 +122,155 @@ def generate_quiz_with_llm(content: str, title: str, sections: List[str], num_qu
             "related_topics": ["General Knowledge", "Further Reading"]
         }
 
-def generate_quiz_questions(content: str, num_questions: int) -> List[Dict]:
+async def submit_batch(articles: List[Dict], num_questions: int = 7) -> str:
     """
-    Use Gemini LLM to generate quiz questions from article content.
+    Submit one Gemini batch job with a quiz prompt per article.
+    Batch mode is cheaper than real-time calls; results are fetched later
+    with get_batch_results.
+    
+    Args:
+        articles: Scraped articles, each with "content" and "title"
+        num_questions: Number of questions to generate per article (5-10)
+    
+    Returns:
+        Name of the created batch job
+    """
+    num_questions = max(5, min(10, num_questions))
+    
+    prompts = await asyncio.gather(*(
+        build_quiz_prompt(a["content"], a["title"], num_questions) for a in articles
+    ))
+    inline_requests = [
+        {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "config": {"temperature": 0.7}
+        }
+        for prompt in prompts
+    ]
+    
+    job = await get_genai_client().aio.batches.create(
+        model=MODEL_NAME,
+        src=inline_requests,
+        config={"display_name": "wiki-quiz"}
+    )
+    logger.info(f"Submitted batch job {job.name} with {len(articles)} articles")
+    return job.name
+
+async def get_batch_results(job_name: str, num_questions: int = 7) -> Optional[List[Dict]]:
+    """
+    Fetch results of a batch job submitted with submit_batch.
+    
+    Returns:
+        None while the job is still running, otherwise one quiz dictionary
+        per submitted article, in submission order
+    
+    Raises:
+        BatchJobFailedError: if the job ended in a failed state
+    """
+    num_questions = max(5, min(10, num_questions))
+    
+    job = await get_genai_client().aio.batches.get(name=job_name)
+    state = job.state.name if job.state else None
+    if state in BATCH_FAILED_STATES:
+        raise BatchJobFailedError(f"Batch job {job_name} finished with state {state}")
+    if state not in BATCH_SUCCEEDED_STATES:
+        return None
+    
+    # Partially succeeded jobs carry per-request errors, handled below
+    results = []
+    for inlined in (job.dest.inlined_responses if job.dest else None) or []:
+        response_text = inlined.response.text if inlined.response else None
+        if inlined.error or not response_text:
+            logger.error(f"Batch request failed in {job_name}: {inlined.error}")
+            results.append({
+                "quiz": generate_fallback_quiz(),
+                "related_topics": ["General Knowledge", "Further Reading"]
+            })
+        else:
+            results.append(parse_quiz_response(response_text.strip(), num_questions))
+    
+    return results
+
+async def build_quiz_prompt(content: str, title: str, num_questions: int) -> str:
+    """
+    Build the grounded quiz + related topics prompt.
     Prompt is grounded to minimize hallucination.
     """
-    try:
-        # Truncate content to reasonable length for API
-        max_length = 8000
-        if len(content) > max_length:
-            content = content[:max_length] + "..."
-        
-        # Create prompt
-        prompt = QUIZ_GENERATION_PROMPT.format(
-            content=content,
-            num_questions=num_questions
-        )
-        
-        # Call LLM
-        response = llm.invoke(prompt)
-        response_text = response.content.strip()
-        
-        # Parse JSON response
-        quiz_questions = parse_json_safely(response_text)
-        
-        # Validate and clean questions
-        validated_questions = validate_quiz_questions(quiz_questions)
-        
-        # Ensure we have enough questions
-        while len(validated_questions) < num_questions and len(validated_questions) < 10:
-            logger.warning(f"Generated only {len(validated_questions)} questions, attempting regeneration...")
+    # Truncate content to the token budget before templating
+    content = await trim_to_tokens(content, MAX_CONTENT_TOKENS)
+    
+    return QUIZ_GENERATION_PROMPT.format(
+        content=content,
+        title=title,
+        num_questions=num_questions
+    )
+
+def parse_quiz_response(response_text: str, num_questions: int) -> Dict:
+    """
+    Parse the LLM response into validated quiz questions and related topics.
+    """
+    data = parse_json_safely(response_text)
+    if not isinstance(data, dict):
+        data = {}
+    
+    # Validate and clean questions
+    quiz_questions = data.get("quiz")
+    validated_questions = validate_quiz_questions(quiz_questions if isinstance(quiz_questions, list) else [])
+    
+    # Ensure we have enough questions
+    if len(validated_questions) < num_questions:
+        logger.warning(f"Generated only {len(validated_questions)} questions, padding with fallback...")
+        while len(validated_questions) < num_questions:
             validated_questions.extend(generate_fallback_quiz()[:num_questions - len(validated_questions)])
-        
-        return validated_questions[:num_questions]
     
-    except Exception as e:
-        logger.error(f"Error generating quiz questions: {str(e)}")
-        return generate_fallback_quiz()
+    # Validate topics
+    topics = data.get("related_topics")
+    if isinstance(topics, list) and all(isinstance(t, str) for t in topics):
+        related_topics = [t.strip() for t in topics if t.strip()][:7]
+    else:
+        related_topics = ["Further Reading", "Related Articles"]
+    
+    return {
+        "quiz": validated_questions[:num_questions],
+        "related_topics": related_topics
+    }
+
+# ============ HELPER FUNCTIONS ============
 
-def generate_related_topics(content: str, title: str) -> List[str]:
+async def trim_to_tokens(content: str, max_tokens: int) -> str:
     """
-    Use Gemini LLM to suggest related Wikipedia topics.
+    Truncate content to roughly max_tokens Gemini tokens.
+    Falls back to ~4 characters per token if counting fails.
     """
-    try:
-        # Truncate content
-        max_length = 5000
-        if len(content) > max_length:
-            content = content[:max_length] + "..."
-        
-        # Create prompt
-        prompt = RELATED_TOPICS_PROMPT.format(
-            title=title,
-            content=content
-        )
-        
-        # Call LLM
-        response = llm.invoke(prompt)
-        response_text = response.content.strip()
-        
-        # Parse JSON response
-        topics = parse_json_safely(response_text)
-        
-        # Validate topics
-        if isinstance(topics, list) and all(isinstance(t, str) for t in topics):
-            return [t.strip() for t in topics if t.strip()][:7]
-        
-        return ["Further Reading", "Related Articles"]
+    # A token is at least one character, so short content always fits
+    if len(content) <= max_tokens:
+        return content
     
+    try:
+        total_tokens = await count_tokens(content)
     except Exception as e:
-        logger.error(f"Error generating related topics: {str(e)}")
-        return ["Further Reading", "Related Articles"]
+        logger.warning(f"Token counting failed, estimating instead: {str(e)}")
+        total_tokens = len(content) // 4
+    
+    if total_tokens <= max_tokens:
+        return content
+    
+    # Cut proportionally; tokens are spread evenly enough over prose
+    return content[:len(content) * max_tokens // total_tokens] + "..."
 
-# ============ HELPER FUNCTIONS ============
+@alru_cache(maxsize=256)
+async def count_tokens(text: str) -> int:
+    """Count Gemini tokens for text (cached, so re-runs skip the API call)."""
+    async with token_count_semaphore:
+        response = await get_genai_client().aio.models.count_tokens(model=MODEL_NAME, contents=text)
+    return response.total_tokens
+
+def get_genai_client() -> genai.Client:
+    """Return the shared Gemini client, creating it on first use."""
+    global _genai_client
+    if _genai_client is None:
+        _genai_client = genai.Client(api_key=GOOGLE_API_KEY)
+    return _genai_client
 
 def parse_json_safely(text: str):
     """
@@ -187,13 +278,11 @@ def parse_json_safely(text: str):
     """
     try:
         # Remove markdown code blocks if present
-        text = re.sub(r'```json\n?', '', text)
-        text = re.sub(r'```\n?', '', text)
-        text = text.strip()
+        text = CODEFENCE_RE.sub('', text).strip()
         
         # Attempt to parse
-        return json.loads(text)
-    except json.JSONDecodeError as e:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError as e:
         logger.error(f"JSON parsing error: {str(e)}")
         logger.debug(f"Failed to parse: {text[:200]}")
         return []
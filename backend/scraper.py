@@ -1,126 +1,323 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import httpx
+import orjson
 import re
-from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+from async_lru import alru_cache
+from selectolax.lexbor import LexborHTMLParser
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
-def scrape_wikipedia(url: str, preview: bool = False) -> Dict:
+WIKI_REST_URL = "https://en.wikipedia.org/api/rest_v1"
+WIKI_ACTION_URL = "https://en.wikipedia.org/w/api.php"
+
+# Top-level "== Section ==" headings in plain-text extracts, and any heading line
+SECTION_HEADING_RE = re.compile(r'^==\s*([^=].*?)\s*==\s*$', re.MULTILINE)
+ANY_HEADING_RE = re.compile(r'^=+\s*(.*?)\s*=+\s*$', re.MULTILINE)
+
+# Entity heuristics: link targets containing these words
+ORG_RE = re.compile(r'University|College|Institute')
+LOC_RE = re.compile(r'City|Country|Region|State')
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Shared client so connections to Wikipedia stay warm between requests
+client = httpx.AsyncClient(
+    http2=True,
+    timeout=10,
+    headers=HEADERS,
+    follow_redirects=True,
+    # httpx drops idle connections after 5s by default; keep them longer
+    # so sporadic requests don't pay a new TCP+TLS handshake each time
+    limits=httpx.Limits(max_keepalive_connections=50, max_connections=100, keepalive_expiry=60)
+)
+
+# In-process caches; entries expire so article edits are eventually picked up
+CACHE_TTL = 600
+
+async def warm_client():
+    """Open a connection to Wikipedia ahead of the first request (called on app startup)."""
+    try:
+        await client.head(f"{WIKI_REST_URL}/")
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not warm up Wikipedia connection: {str(e)}")
+
+async def close_client():
+    """Close the shared HTTP client (called on app shutdown)."""
+    await client.aclose()
+
+async def scrape_wikipedia(url: str, preview: bool = False, legacy: bool = False) -> Dict:
     """
     Scrape Wikipedia article and extract structured content.
+    Uses the Wikipedia APIs, falling back to scraping the rendered HTML
+    page if they fail.
     
     Args:
         url: Wikipedia article URL
         preview: If True, only fetch title (fast validation)
+        legacy: If True, skip the APIs and scrape the HTML page
     
     Returns:
         Dictionary containing title, summary, sections, entities, and raw HTML
+        (raw HTML is None when the APIs were used)
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract title
-        title = soup.find('h1', class_='firstHeading')
-        title_text = title.get_text() if title else "Unknown"
+        if not legacy:
+            try:
+                return await scrape_via_api(url, preview)
+            except Exception as e:
+                logger.warning(f"Wikipedia API failed for {url}, scraping HTML instead: {str(e)}")
         
         if preview:
-            return {"title": title_text}
-        
-        # Extract summary (first paragraph)
-        summary = extract_summary(soup)
+            return {"title": await fetch_title(url)}
         
-        # Extract sections and content
-        sections = extract_sections(soup)
+        # Copy so callers can't modify the cached entry
+        scraped_data = dict(await fetch_article(url))
         
-        # Combine all content for LLM
-        full_content = f"Title: {title_text}\n\nSummary: {summary}\n\n"
-        for section in sections:
-            full_content += f"## {section['title']}\n{section['content']}\n\n"
+        logger.info(f"Successfully scraped: {scraped_data['title']}")
         
-        # Extract key entities (people, organizations, locations)
-        key_entities = extract_entities(soup)
-        
-        logger.info(f"Successfully scraped: {title_text}")
-        
-        return {
-            "title": title_text,
-            "summary": summary,
-            "sections": [s["title"] for s in sections],
-            "content": full_content,
-            "key_entities": key_entities,
-            "raw_html": response.text  # Store original HTML
-        }
-    
-    except requests.exceptions.RequestException as e:
+        return scraped_data
+    
+    except httpx.HTTPError as e:
         logger.error(f"Network error scraping {url}: {str(e)}")
         raise Exception(f"Failed to fetch URL: {str(e)}")
     except Exception as e:
         logger.error(f"Error scraping {url}: {str(e)}")
         raise Exception(f"Error processing Wikipedia page: {str(e)}")
 
-def extract_summary(soup: BeautifulSoup) -> str:
+async def scrape_via_api(url: str, preview: bool = False) -> Dict:
+    """Fetch article data from the Wikipedia REST and Action APIs."""
+    title = article_title(url)
+    
+    if preview:
+        summary = await fetch_summary(title)
+        return {"title": summary_title(summary, title)}
+    
+    # Copy so callers can't modify the cached entry
+    scraped_data = dict(await fetch_article_api(title))
+    
+    logger.info(f"Successfully fetched via API: {scraped_data['title']}")
+    
+    return scraped_data
+
+def article_title(url: str) -> str:
+    """Extract the article title from a Wikipedia URL."""
+    title = url.split('/wiki/', 1)[1].split('#')[0].split('?')[0]
+    return unquote(title).replace('_', ' ')
+
+def summary_title(summary: Dict, default: str) -> str:
+    """Readable title from a REST summary response."""
+    return summary.get("titles", {}).get("normalized") or summary.get("title") or default
+
+@alru_cache(maxsize=256, ttl=CACHE_TTL)
+async def fetch_summary(title: str) -> Dict:
+    """Fetch the REST page summary (title and lead extract, ~2KB)."""
+    response = await client.get(f"{WIKI_REST_URL}/page/summary/{quote(title.replace(' ', '_'), safe='')}")
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+async def fetch_extract(title: str) -> Dict:
+    """Fetch the plain-text article extract."""
+    response = await client.get(WIKI_ACTION_URL, params={
+        "action": "query",
+        "prop": "extracts",
+        "explaintext": 1,
+        "exsectionformat": "wiki",
+        "redirects": 1,
+        "titles": title,
+        "format": "json",
+        "formatversion": 2
+    })
+    response.raise_for_status()
+    
+    page = orjson.loads(response.content)["query"]["pages"][0]
+    if page.get("missing") or "extract" not in page:
+        raise Exception(f"Article not found: {title}")
+    return page
+
+async def fetch_lead_html(title: str) -> str:
+    """
+    Fetch the rendered HTML of the lead section only.
+    Used for entity links, which need article order (prop=links is alphabetical).
+    """
+    response = await client.get(WIKI_ACTION_URL, params={
+        "action": "parse",
+        "page": title,
+        "prop": "text",
+        "section": 0,
+        "redirects": 1,
+        "format": "json",
+        "formatversion": 2
+    })
+    response.raise_for_status()
+    
+    data = orjson.loads(response.content)
+    if "error" in data:
+        raise Exception(f"Article not found: {title}")
+    return data["parse"]["text"]
+
+@alru_cache(maxsize=64, ttl=CACHE_TTL)
+async def fetch_article_api(title: str) -> Dict:
+    """Fetch summary, full extract and lead HTML concurrently and build the article."""
+    summary, page, lead_html = await asyncio.gather(
+        fetch_summary(title), fetch_extract(title), fetch_lead_html(title)
+    )
+    
+    title_text = summary_title(summary, title)
+    summary_text = summary.get("extract", "")
+    sections = extract_api_sections(page["extract"])
+    key_entities = extract_entities(LexborHTMLParser(lead_html), container='.mw-parser-output')
+    
+    return {
+        "title": title_text,
+        "summary": summary_text,
+        "sections": [s["title"] for s in sections],
+        "content": build_content(title_text, summary_text, sections),
+        "key_entities": key_entities,
+        "raw_html": None
+    }
+
+def extract_api_sections(extract: str, max_sections: int = 10) -> List[Dict]:
+    """Split a plain-text extract into top-level sections with their content."""
+    # re.split with a group gives [intro, title1, body1, title2, body2, ...]
+    parts = SECTION_HEADING_RE.split(extract)
+    titles, bodies = parts[1::2][:max_sections], parts[2::2]
+    
+    sections = []
+    for section_title, body in zip(titles, bodies):
+        # Keep subsection text, drop the "=== Subsection ===" markup
+        content_text = " ".join(ANY_HEADING_RE.sub(r'\1', body).split())
+        if content_text:
+            sections.append({
+                "title": section_title,
+                "content": content_text[:1000]  # Limit content length
+            })
+    
+    return sections
+
+# Full pages are large (raw HTML included), so keep fewer of them
+@alru_cache(maxsize=32, ttl=CACHE_TTL)
+async def fetch_article(url: str) -> Dict:
+    """Download and parse a full article."""
+    response = await client.get(url)
+    response.raise_for_status()
+    
+    # Parsing is CPU-bound, keep it off the event loop
+    scraped_data = await asyncio.to_thread(parse_article, response.content)
+    scraped_data["raw_html"] = response.text  # Store original HTML
+    return scraped_data
+
+@alru_cache(maxsize=256, ttl=CACHE_TTL)
+async def fetch_title(url: str) -> str:
+    """
+    Fetch only the article title.
+    Streams the page and stops reading once the heading has arrived.
+    """
+    head = bytearray()
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(8192):
+            # Only search the new bytes, overlapping in case the tag was split
+            start = max(0, len(head) - 4)
+            head += chunk
+            end = head.find(b"</h1>", start)
+            if end != -1:
+                # Parse just the page up to the heading
+                del head[end + 5:]
+                break
+    
+    title = LexborHTMLParser(bytes(head)).css_first('h1.firstHeading')
+    return title.text() if title else "Unknown"
+
+def parse_article(html: bytes) -> Dict:
+    """Parse article HTML into title, summary, sections, content and entities."""
+    tree = LexborHTMLParser(html)
+    
+    # Extract title
+    title = tree.css_first('h1.firstHeading')
+    title_text = title.text() if title else "Unknown"
+    
+    # Extract summary (first paragraph)
+    summary = extract_summary(tree)
+    
+    # Extract sections and content
+    sections = extract_sections(tree)
+    
+    # Extract key entities (people, organizations, locations)
+    key_entities = extract_entities(tree)
+    
+    return {
+        "title": title_text,
+        "summary": summary,
+        "sections": [s["title"] for s in sections],
+        "content": build_content(title_text, summary, sections),
+        "key_entities": key_entities
+    }
+
+def build_content(title: str, summary: str, sections: List[Dict]) -> str:
+    """Combine title, summary and sections into the text sent to the LLM."""
+    parts = [f"Title: {title}\n\nSummary: {summary}\n\n"]
+    parts.extend(f"## {section['title']}\n{section['content']}\n\n" for section in sections)
+    return "".join(parts)
+
+def extract_summary(tree: LexborHTMLParser) -> str:
     """Extract the first paragraph as summary."""
     try:
-        content = soup.find('div', {'id': 'mw-content-text'})
-        if not content:
-            return ""
-        
         # Find first paragraph that has substantial text
-        paragraphs = content.find_all('p', recursive=False)
+        paragraphs = tree.css('#mw-content-text > p')
         for p in paragraphs:
-            text = p.get_text().strip()
+            text = p.text().strip()
             if len(text) > 100:
                 return text
         
-        return paragraphs[0].get_text() if paragraphs else ""
+        return paragraphs[0].text() if paragraphs else ""
     except Exception as e:
         logger.warning(f"Error extracting summary: {str(e)}")
         return ""
 
-def extract_sections(soup: BeautifulSoup, max_sections: int = 10) -> List[Dict]:
+def extract_sections(tree: LexborHTMLParser, max_sections: int = 10) -> List[Dict]:
     """
     Extract major sections with their content.
     Bonus: Section-wise organization for UI.
     """
     try:
         sections = []
-        content_div = soup.find('div', {'id': 'mw-content-text'})
+        content_div = tree.css_first('#mw-content-text')
         
         if not content_div:
             return sections
         
         # Find all h2 headers (main sections)
-        h2_tags = content_div.find_all('h2', limit=max_sections)
+        h2_tags = content_div.css('h2')[:max_sections]
         
         for h2 in h2_tags:
-            section_title = h2.get_text().strip()
+            section_title = h2.text().strip()
             
             # Skip edit links
             if '[edit]' in section_title:
                 section_title = section_title.replace('[edit]', '').strip()
             
             # Extract content between this h2 and next h2
-            content_text = ""
-            current = h2.next_sibling
+            parts = []
+            length = 0
+            current = h2.next
             
-            while current and current.name != 'h2':
-                if hasattr(current, 'get_text'):
-                    text = current.get_text().strip()
-                    if len(text) > 0 and text not in ['\n', ' ']:
-                        content_text += text + " "
-                current = current.next_sibling
+            # Stop once there's enough text for the length limit below
+            while current and current.tag != 'h2' and length < 1000:
+                text = current.text().strip()
+                if len(text) > 0 and text not in ['\n', ' ']:
+                    parts.append(text)
+                    length += len(text) + 1
+                current = current.next
             
-            if content_text.strip():
+            if parts:
                 sections.append({
                     "title": section_title,
-                    "content": content_text[:1000]  # Limit content length
+                    "content": " ".join(parts)[:1000]  # Limit content length
                 })
         
         return sections
@@ -128,38 +325,49 @@ def extract_sections(soup: BeautifulSoup, max_sections: int = 10) -> List[Dict]:
         logger.warning(f"Error extracting sections: {str(e)}")
         return []
 
-def extract_entities(soup: BeautifulSoup) -> Dict[str, List[str]]:
+def extract_entities(tree: LexborHTMLParser, container: str = '#mw-content-text') -> Dict[str, List[str]]:
     """
     Extract named entities (people, organizations, locations).
     This is a simple heuristic-based approach.
+    
+    Args:
+        tree: Parsed article HTML
+        container: Selector of the element holding the article body
     """
     try:
-        entities = {"people": [], "organizations": [], "locations": []}
-        
-        # Look for links in the article that might indicate entities
-        content_div = soup.find('div', {'id': 'mw-content-text'})
-        if not content_div:
-            return entities
-        
-        # Find all internal Wikipedia links
-        links = content_div.find_all('a', href=re.compile(r'^/wiki/'))
-        
-        for link in links[:20]:  # Limit to first 20 links
-            link_text = link.get_text().strip()
-            href = link.get('href', '')
-            
-            # Simple heuristic: if link ends with common suffixes, classify
-            if any(suffix in href for suffix in ['University', 'College', 'Institute']):
-                entities["organizations"].append(link_text)
-            elif any(suffix in href for suffix in ['City', 'Country', 'Region', 'State']):
-                entities["locations"].append(link_text)
-            elif link_text and len(link_text) < 30:  # Names are usually short
-                entities["people"].append(link_text)
-        
-        # Remove duplicates
-        entities = {k: list(set(v))[:5] for k, v in entities.items()}
+        # Look for internal Wikipedia links in the article that might indicate entities
+        links = tree.css(f'{container} a[href^="/wiki/"]')
         
-        return entities
+        return classify_entities([
+            (link.text().strip(), link.attributes.get('href') or '')
+            for link in links[:20]  # Limit to first 20 links
+        ])
     except Exception as e:
         logger.warning(f"Error extracting entities: {str(e)}")
-        return {"people": [], "organizations": [], "locations": []}
\ No newline at end of file
+        return {"people": [], "organizations": [], "locations": []}
+
+def classify_entities(links: List[Tuple[str, str]]) -> Dict[str, List[str]]:
+    """
+    Classify (link text, link target) pairs into people, organizations
+    and locations.
+    """
+    # Dicts dedupe while keeping first-seen order
+    people, organizations, locations = {}, {}, {}
+    
+    for link_text, href in links:
+        # Simple heuristic: if link ends with common suffixes, classify
+        if ORG_RE.search(href):
+            organizations.setdefault(link_text, None)
+        elif LOC_RE.search(href):
+            locations.setdefault(link_text, None)
+        elif link_text and len(link_text) < 30:  # Names are usually short
+            people.setdefault(link_text, None)
+        
+        if len(people) >= 5 and len(organizations) >= 5 and len(locations) >= 5:
+            break
+    
+    return {
+        "people": list(people)[:5],
+        "organizations": list(organizations)[:5],
+        "locations": list(locations)[:5]
+    }
@@ -3,6 +3,8 @@ import QuizDisplay from './QuizDisplay';
 import LoadingSpinner from './LoadingSpinner';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+const POLL_INTERVAL_MS = 2000;
+const MAX_POLLS = 150; // ~5 minutes
 
 function GenerateQuizTab() {
   const [url, setUrl] = useState('');
@@ -49,6 +51,28 @@ function GenerateQuizTab() {
     }
   };
 
+  // Poll a queued quiz until the backend finishes processing it
+  const waitForQuiz = async (quiz) => {
+    for (let polls = 0; ['pending', 'queued', 'submitting'].includes(quiz.status); polls++) {
+      if (polls >= MAX_POLLS) {
+        throw new Error('Quiz generation is taking too long. Check the History tab later.');
+      }
+      await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+
+      const response = await fetch(`${API_URL}/api/quiz/${quiz.id}`);
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.detail || 'Failed to fetch quiz');
+      }
+      quiz = await response.json();
+    }
+
+    if (quiz.status === 'error') {
+      throw new Error('Failed to generate quiz');
+    }
+    return quiz;
+  };
+
   // Generate quiz
   const handleGenerateQuiz = async () => {
     if (!isValidUrl(url)) {
@@ -61,7 +85,7 @@ function GenerateQuizTab() {
       setError('');
       setQuizData(null);
 
-      const response = await fetch(`${API_URL}/api/generate-quiz`, {
+      const response = await fetch(`${API_URL}/api/generate-quiz?realtime=true`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ url }),
@@ -72,7 +96,7 @@ function GenerateQuizTab() {
         throw new Error(errorData.detail || 'Failed to generate quiz');
       }
 
-      const data = await response.json();
+      const data = await waitForQuiz(await response.json());
       setQuizData(data);
       
       // Scroll to results
@@ -121,7 +121,7 @@ function HistoryTab() {
             <tbody>
               {history.map((item) => (
                 <tr key={item.id} className="history-row">
-                  <td className="title-cell">{item.title}</td>
+                  <td className="title-cell">{item.title || `(${item.status})`}</td>
                   <td className="url-cell">
                     <a href={item.url} target="_blank" rel="noopener noreferrer">
                       View →
@@ -137,6 +137,7 @@ function HistoryTab() {
                       onClick={() => handleViewDetails(item.id)}
                       className="action-button details-button"
                       title="View full quiz"
+                      disabled={item.status !== 'done'}
                     >
                       Details
                     </button>